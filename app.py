@@ -1,8 +1,13 @@
-from flask import Flask, render_template, request, flash, redirect, url_for, send_from_directory
+from flask import Flask, render_template, request, flash, redirect, url_for, send_from_directory, jsonify, abort
 import os
-from werkzeug.utils import secure_filename
+import threading
+from werkzeug.utils import secure_filename, safe_join
 from compressor_logic import compress_pdf, compress_image
-from utils import get_formatted_size
+from pdf_presets import PRESETS
+from chunked_upload import ChunkedUploadError, init_upload, upload_status, upload_paths, append_chunk, finalize_upload, abort_upload
+from storage_janitor import StorageJanitor
+from compression_service import CompressionService
+from utils import get_formatted_size, get_file_sha256, create_output_folder, reserve_unique_path
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'  # Required for flashing messages
@@ -12,16 +17,148 @@ UPLOAD_FOLDER = 'uploads'
 COMPRESSED_FOLDER = 'compressed'
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
 
-# Create folders if they don't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(COMPRESSED_FOLDER, exist_ok=True)
-
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['COMPRESSED_FOLDER'] = COMPRESSED_FOLDER
 
+def _env_limit(name, default):
+    # 0 disables the limit
+    value = int(os.environ.get(name, default))
+    return value or None
+
+# Retention: files older than the TTL are deleted, and each folder is trimmed
+# oldest-first while it is over its size quota
+app.config['UPLOAD_TTL_SECONDS'] = _env_limit('UPLOAD_TTL_SECONDS', 6 * 3600)
+app.config['UPLOAD_MAX_BYTES'] = _env_limit('UPLOAD_MAX_BYTES', 0)
+app.config['COMPRESSED_TTL_SECONDS'] = _env_limit('COMPRESSED_TTL_SECONDS', 24 * 3600)
+app.config['COMPRESSED_MAX_BYTES'] = _env_limit('COMPRESSED_MAX_BYTES', 5 * 1024 ** 3)
+app.config['JANITOR_INTERVAL_SECONDS'] = _env_limit('JANITOR_INTERVAL_SECONDS', 60)
+
+# Service mode: with COMPRESSION_WORKERS > 0, compression runs in that many
+# isolated, recycled worker processes with per-job limits instead of in the
+# request thread
+app.config['COMPRESSION_WORKERS'] = _env_limit('COMPRESSION_WORKERS', 0)
+app.config['WORKER_MAX_JOBS'] = _env_limit('WORKER_MAX_JOBS', 50)
+app.config['WORKER_MAX_RSS_BYTES'] = _env_limit('WORKER_MAX_RSS_BYTES', 1024 ** 3)
+app.config['JOB_TIMEOUT_SECONDS'] = _env_limit('JOB_TIMEOUT_SECONDS', 300)
+app.config['JOB_CPU_SECONDS'] = _env_limit('JOB_CPU_SECONDS', 240)
+app.config['JOB_MEMORY_BYTES'] = _env_limit('JOB_MEMORY_BYTES', 3 * 1024 ** 3)
+
+janitor = StorageJanitor(app.config['JANITOR_INTERVAL_SECONDS'])
+_janitor_started = False
+_compression_service = None
+_compression_service_lock = threading.Lock()
+
+def get_compression_service():
+    # Created on first use, so each forked web worker gets its own pool
+    global _compression_service
+    with _compression_service_lock:
+        if _compression_service is None:
+            _compression_service = CompressionService(
+                workers=app.config['COMPRESSION_WORKERS'],
+                max_jobs_per_worker=app.config['WORKER_MAX_JOBS'],
+                max_rss_bytes=app.config['WORKER_MAX_RSS_BYTES'],
+                job_timeout=app.config['JOB_TIMEOUT_SECONDS'],
+                job_cpu_seconds=app.config['JOB_CPU_SECONDS'],
+                job_memory_bytes=app.config['JOB_MEMORY_BYTES']
+            )
+        return _compression_service
+
+def start_janitor(shared=False):
+    """
+    Watches the storage folders and starts the janitor thread, once. Under
+    gunicorn this is called in the master (see gunicorn.conf.py) with
+    shared=True, so a single janitor enforces the TTLs and quotas for all
+    workers; forked workers inherit the started flag and send their file
+    events to it instead of running their own.
+    """
+    global _janitor_started
+    create_output_folder(app.config['UPLOAD_FOLDER'])
+    create_output_folder(app.config['COMPRESSED_FOLDER'])
+    if not _janitor_started:
+        _janitor_started = True
+        janitor.watch(app.config['UPLOAD_FOLDER'], app.config['UPLOAD_TTL_SECONDS'], app.config['UPLOAD_MAX_BYTES'])
+        janitor.watch(app.config['COMPRESSED_FOLDER'], app.config['COMPRESSED_TTL_SECONDS'], app.config['COMPRESSED_MAX_BYTES'])
+        if shared:
+            janitor.share()
+        janitor.start()
+
+def ensure_storage_folders():
+    # Created on demand rather than at import, so importing the app (e.g. in a
+    # pre-fork server master) has no filesystem side effects. Without a
+    # janitor from the server master, this process starts its own.
+    start_janitor()
+
+def remove_upload(input_path):
+    if os.path.exists(input_path):
+        os.remove(input_path)
+    janitor.discard(input_path)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def compress_uploaded_file(input_path, filename, form):
+    """
+    Compresses an uploaded file using the options submitted in `form`.
+    Returns the template/JSON fields describing the result, or None if
+    compression failed. The caller is responsible for removing the upload.
+    """
+    # Prepare compression options based on file type
+    options = {}
+    file_ext = filename.rsplit('.', 1)[1].lower()
+    
+    if file_ext == 'pdf':
+        options = {
+            'recompress_images': 'recompressImages' in form,
+            'image_quality': int(form.get('pdfImageQuality', 75)),
+            'linearize': True,
+            # Empty (or unknown) means the single image quality above
+            'preset': form.get('pdfPreset') if form.get('pdfPreset') in PRESETS else None
+        }
+        kind, compress_func = 'pdf', compress_pdf
+    else:  # Image files
+        if file_ext in ['jpg', 'jpeg']:
+            options = {
+                'jpg_quality': int(form.get('jpgQuality', 85))
+            }
+        else:  # PNG
+            options = {
+                'png_compress_level': int(form.get('pngLevel', 6)),
+                'png_quantize': 'pngQuantize' in form,
+                'png_quantize_colors': int(form.get('pngColors', 256))
+            }
+        kind, compress_func = 'image', compress_image
+
+    # Perform compression
+    if app.config['COMPRESSION_WORKERS']:
+        original_size, compressed_size, output_path = get_compression_service().compress(kind, input_path, options)
+    else:
+        original_size, compressed_size, output_path = compress_func(
+            input_path, 
+            options,
+            progress_callback=None  # Web version doesn't need progress updates
+        )
+
+    if not output_path:
+        return None
+    janitor.register(output_path)
+
+    # Calculate compression ratio
+    if original_size > 0:
+        ratio = ((original_size - compressed_size) / original_size) * 100
+        if compressed_size > original_size:
+            compression_ratio = f"Increased by {abs(ratio):.2f}% (Compressed larger)"
+        else:
+            compression_ratio = f"Reduced by {ratio:.2f}%"
+    else:
+        compression_ratio = "N/A (Original file empty)"
+
+    return {
+        'download_path': os.path.basename(output_path),
+        'original_size': get_formatted_size(original_size),
+        'compressed_size': get_formatted_size(compressed_size),
+        'compression_ratio': compression_ratio
+    }
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -40,78 +177,149 @@ def upload_file():
     if file and allowed_file(file.filename):
         # Secure the filename and save the uploaded file
         filename = secure_filename(file.filename)
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(input_path)
+        ensure_storage_folders()
+        input_path = reserve_unique_path(app.config['UPLOAD_FOLDER'], filename)
 
         try:
-            # Prepare compression options based on file type
-            options = {}
-            file_ext = filename.rsplit('.', 1)[1].lower()
-            
-            if file_ext == 'pdf':
-                options = {
-                    'recompress_images': 'recompressImages' in request.form,
-                    'image_quality': int(request.form.get('pdfImageQuality', 75)),
-                    'linearize': True
-                }
-                compress_func = compress_pdf
-            else:  # Image files
-                if file_ext in ['jpg', 'jpeg']:
-                    options = {
-                        'jpg_quality': int(request.form.get('jpgQuality', 85))
-                    }
-                else:  # PNG
-                    options = {
-                        'png_compress_level': int(request.form.get('pngLevel', 6)),
-                        'png_quantize': 'pngQuantize' in request.form,
-                        'png_quantize_colors': int(request.form.get('pngColors', 256))
-                    }
-                compress_func = compress_image
-
-            # Perform compression
-            original_size, compressed_size, output_path = compress_func(
-                input_path, 
-                options,
-                progress_callback=None  # Web version doesn't need progress updates
-            )
-
-            if output_path:
-                # Get the filename from the output path
-                download_filename = os.path.basename(output_path)
-                
-                # Calculate compression ratio
-                if original_size > 0:
-                    ratio = ((original_size - compressed_size) / original_size) * 100
-                    if compressed_size > original_size:
-                        compression_ratio = f"Increased by {abs(ratio):.2f}% (Compressed larger)"
-                    else:
-                        compression_ratio = f"Reduced by {ratio:.2f}%"
-                else:
-                    compression_ratio = "N/A (Original file empty)"
-
-                # Clean up the uploaded file
-                os.remove(input_path)
-
-                return render_template('index.html',
-                    download_path=download_filename,
-                    original_size=get_formatted_size(original_size),
-                    compressed_size=get_formatted_size(compressed_size),
-                    compression_ratio=compression_ratio
-                )
-
+            file.save(input_path)
+            result = compress_uploaded_file(input_path, filename, request.form)
         except Exception as e:
             flash(f'Error during compression: {str(e)}', 'error')
-            # Clean up on error
-            if os.path.exists(input_path):
-                os.remove(input_path)
             return redirect(url_for('index'))
+        finally:
+            # Always clean up the uploaded file, whatever the outcome
+            remove_upload(input_path)
+
+        if result:
+            return render_template('index.html', **result)
+        flash('Error during compression. Please check the file and try again.', 'error')
+        return redirect(url_for('index'))
 
     flash('Invalid file type. Please upload PDF, JPG, or PNG files.', 'error')
     return redirect(url_for('index'))
 
+# --- Chunked (resumable) uploads ---
+# 1. POST /upload/chunked                     form: filename, size[, sha256]
+# 2. PUT  /upload/chunked/<id>?offset=N       body: raw chunk, header X-Chunk-SHA256
+#    GET  /upload/chunked/<id>                -> bytes received so far, to resume
+# 3. POST /upload/chunked/<id>/finalize       form: same compression options as /upload
+# All endpoints answer with JSON.
+
+@app.errorhandler(ChunkedUploadError)
+def handle_chunked_upload_error(e):
+    return jsonify(error=str(e)), e.status_code
+
+@app.route('/upload/chunked', methods=['POST'])
+def chunked_upload_init():
+    filename = secure_filename(request.form.get('filename', ''))
+    if not filename or not allowed_file(filename):
+        raise ChunkedUploadError('Invalid file type. Please upload PDF, JPG, or PNG files.')
+    try:
+        total_size = int(request.form['size'])
+    except (KeyError, ValueError):
+        raise ChunkedUploadError('Missing or invalid upload size.')
+    ensure_storage_folders()
+    status = init_upload(app.config['UPLOAD_FOLDER'], filename, total_size, request.form.get('sha256'))
+    # Abandoned uploads are expired by the janitor like any other upload
+    for path in upload_paths(app.config['UPLOAD_FOLDER'], status['upload_id']):
+        janitor.register(path)
+    return jsonify(status), 201
+
+@app.route('/upload/chunked/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    return jsonify(upload_status(app.config['UPLOAD_FOLDER'], upload_id))
+
+@app.route('/upload/chunked/<upload_id>', methods=['PUT'])
+def chunked_upload_append(upload_id):
+    chunk_sha256 = request.headers.get('X-Chunk-SHA256')
+    if not chunk_sha256:
+        raise ChunkedUploadError('Missing X-Chunk-SHA256 header.')
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        raise ChunkedUploadError('Missing or invalid chunk offset.')
+    status = append_chunk(app.config['UPLOAD_FOLDER'], upload_id, offset, request.stream, chunk_sha256)
+    # Refresh both files' age and size, so an upload still in progress is
+    # never expired or evicted as stale
+    for path in upload_paths(app.config['UPLOAD_FOLDER'], upload_id):
+        janitor.register(path)
+    return jsonify(status)
+
+@app.route('/upload/chunked/<upload_id>', methods=['DELETE'])
+def chunked_upload_abort(upload_id):
+    abort_upload(app.config['UPLOAD_FOLDER'], upload_id)
+    for path in upload_paths(app.config['UPLOAD_FOLDER'], upload_id):
+        janitor.discard(path)
+    return '', 204
+
+@app.route('/upload/chunked/<upload_id>/finalize', methods=['POST'])
+def chunked_upload_finalize(upload_id):
+    filename = upload_status(app.config['UPLOAD_FOLDER'], upload_id)['filename']
+    ensure_storage_folders()
+    # Assemble straight into the path the compressor reads from
+    input_path = reserve_unique_path(app.config['UPLOAD_FOLDER'], filename)
+    try:
+        finalize_upload(app.config['UPLOAD_FOLDER'], upload_id, input_path)
+        for path in upload_paths(app.config['UPLOAD_FOLDER'], upload_id):
+            janitor.discard(path)
+        result = compress_uploaded_file(input_path, filename, request.form)
+    except ChunkedUploadError:
+        raise
+    except Exception as e:
+        result = None
+        print(f"Error compressing chunked upload {filename}: {e}")
+    finally:
+        remove_upload(input_path)
+
+    if not result:
+        return jsonify(error='Error during compression.'), 500
+
+    result['download_url'] = url_for('download_file', filename=result['download_path'])
+    return jsonify(result)
+
+# --- Downloads ---
+# Content-hash ETags, keyed by path and invalidated when size/mtime change
+ETAG_CACHE_SIZE = 4096
+_etag_cache = {}
+
+def get_content_etag(path):
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _etag_cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    etag = get_file_sha256(path)
+    if len(_etag_cache) >= ETAG_CACHE_SIZE:
+        _etag_cache.clear() # Output names are unique, so old entries are rarely reused
+    _etag_cache[path] = (key, etag)
+    return etag
+
 @app.route('/download/<filename>')
 def download_file(filename):
-    return send_from_directory(app.config['COMPRESSED_FOLDER'], filename, as_attachment=True)
+    # Absolute, because Flask would otherwise resolve it against the app root
+    # rather than the working directory the compressor writes into
+    folder = os.path.abspath(app.config['COMPRESSED_FOLDER'])
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    # send_from_directory handles Range/If-Range and If-None-Match itself
+    # (conditional=True), so clients and CDNs can resume and revalidate
+    response = send_from_directory(
+        folder, filename,
+        as_attachment=True, etag=get_content_etag(path), max_age=0
+    )
+    response.cache_control.public = True
+    return response
+
+@app.route('/storage/stats')
+def storage_stats():
+    ensure_storage_folders()
+    return jsonify(janitor.stats())
+
+@app.route('/service/stats')
+def service_stats():
+    if not app.config['COMPRESSION_WORKERS']:
+        return jsonify(enabled=False)
+    return jsonify(enabled=True, **get_compression_service().stats())
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,175 @@
+# universal_file_compressor/chunked_upload.py
+import os
+import json
+import uuid
+import hashlib
+import string
+from typing import Optional, Dict, Any, BinaryIO, Tuple
+from utils import get_file_sha256
+
+try:
+    import fcntl # POSIX only; appends are not serialized elsewhere
+except ImportError:
+    fcntl = None
+
+# Largest chunk accepted by a single append request
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# Block size used when streaming request bodies
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class ChunkedUploadError(Exception):
+    """Raised when a chunked upload request cannot be applied."""
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _is_valid_upload_id(upload_id: str) -> bool:
+    # upload ids are uuid4 hex strings; anything else could escape the folder
+    return len(upload_id) == 32 and all(c in string.hexdigits for c in upload_id)
+
+def _meta_path(folder: str, upload_id: str) -> str:
+    return os.path.join(folder, f"{upload_id}.json")
+
+def _part_path(folder: str, upload_id: str) -> str:
+    return os.path.join(folder, f"{upload_id}.part")
+
+def upload_paths(folder: str, upload_id: str) -> Tuple[str, str]:
+    """Returns the (part file, metadata file) paths backing an upload."""
+    if not _is_valid_upload_id(upload_id):
+        raise ChunkedUploadError("Invalid upload id.", 404)
+    return _part_path(folder, upload_id), _meta_path(folder, upload_id)
+
+def _load_meta(folder: str, upload_id: str) -> Dict[str, Any]:
+    if not _is_valid_upload_id(upload_id):
+        raise ChunkedUploadError("Invalid upload id.", 404)
+    try:
+        with open(_meta_path(folder, upload_id), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise ChunkedUploadError("Unknown upload id.", 404)
+
+
+def init_upload(folder: str, filename: str, total_size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Starts a chunked upload of `total_size` bytes that will become `filename`
+    inside `folder` once finalized. `sha256` optionally pins the digest of the
+    whole file, checked at finalize time.
+    Returns the upload status (see upload_status).
+    """
+    if total_size < 0:
+        raise ChunkedUploadError("Upload size must not be negative.")
+    upload_id = uuid.uuid4().hex
+    meta = {
+        "filename": filename,
+        "size": total_size,
+        "sha256": sha256.lower() if sha256 else None,
+    }
+    # Create the (empty) part file first so a half-written init never leaves
+    # metadata pointing at nothing
+    open(_part_path(folder, upload_id), "wb").close()
+    with open(_meta_path(folder, upload_id), "w") as f:
+        json.dump(meta, f)
+    return upload_status(folder, upload_id)
+
+
+def upload_status(folder: str, upload_id: str) -> Dict[str, Any]:
+    """
+    Returns {"upload_id", "filename", "size", "offset"} for an upload.
+    `offset` is the number of bytes received so far; a client resuming after a
+    dropped connection continues from there.
+    """
+    meta = _load_meta(folder, upload_id)
+    offset = os.path.getsize(_part_path(folder, upload_id))
+    return {
+        "upload_id": upload_id,
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "offset": offset,
+    }
+
+
+def append_chunk(
+    folder: str,
+    upload_id: str,
+    offset: int,
+    stream: BinaryIO,
+    chunk_sha256: str
+) -> Dict[str, Any]:
+    """
+    Appends the bytes read from `stream` at `offset`, verifying them against
+    `chunk_sha256`. The chunk is streamed straight into the part file and
+    rolled back if the checksum does not match.
+    Re-sending a chunk that was already stored (a retry after a lost response)
+    is accepted as a no-op. Concurrent appends to the same upload (a retry
+    overlapping the original request) are serialized with an exclusive lock
+    on the part file, so a rollback never discards another request's data.
+    Returns the upload status after the append.
+    """
+    meta = _load_meta(folder, upload_id)
+    part_path = _part_path(folder, upload_id)
+    # Mark the upload as active so retention (which goes by mtime) doesn't
+    # expire the metadata of an upload that is still receiving chunks
+    os.utime(_meta_path(folder, upload_id))
+
+    with open(part_path, "r+b") as part:
+        if fcntl is not None:
+            fcntl.flock(part, fcntl.LOCK_EX) # Released when the file is closed
+        part.seek(0, os.SEEK_END)
+        current = part.tell()
+        if offset < current:
+            # Already have these bytes; tell the client where to continue
+            return upload_status(folder, upload_id)
+        if offset > current:
+            raise ChunkedUploadError(f"Chunk offset {offset} is past the received data ({current} bytes).", 409)
+
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            while True:
+                block = stream.read(COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                written += len(block)
+                if written > MAX_CHUNK_SIZE or current + written > meta["size"]:
+                    raise ChunkedUploadError("Chunk exceeds the allowed or declared size.", 413)
+                digest.update(block)
+                part.write(block)
+            if digest.hexdigest() != chunk_sha256.lower():
+                raise ChunkedUploadError("Chunk checksum mismatch.", 422)
+        except Exception:
+            part.truncate(current)
+            raise
+
+    return upload_status(folder, upload_id)
+
+
+def finalize_upload(folder: str, upload_id: str, target_path: str) -> str:
+    """
+    Checks that every byte has arrived (and the whole-file digest, if one was
+    given at init), then moves the assembled file to `target_path`.
+    Returns `target_path`.
+    """
+    meta = _load_meta(folder, upload_id)
+    part_path = _part_path(folder, upload_id)
+
+    received = os.path.getsize(part_path)
+    if received != meta["size"]:
+        raise ChunkedUploadError(f"Upload incomplete: {received} of {meta['size']} bytes received.", 409)
+    if meta.get("sha256") and get_file_sha256(part_path) != meta["sha256"]:
+        abort_upload(folder, upload_id)
+        raise ChunkedUploadError("File checksum mismatch; upload discarded.", 422)
+
+    os.replace(part_path, target_path)
+    os.remove(_meta_path(folder, upload_id))
+    return target_path
+
+
+def abort_upload(folder: str, upload_id: str) -> None:
+    """Discards an upload and its received data."""
+    if not _is_valid_upload_id(upload_id):
+        raise ChunkedUploadError("Invalid upload id.", 404)
+    for path in (_part_path(folder, upload_id), _meta_path(folder, upload_id)):
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,253 @@
+# universal_file_compressor/compression_service.py
+import os
+import sys
+import time
+import queue
+import threading
+import multiprocessing
+from typing import Optional, Tuple, Callable, Dict, Any
+from compressor_logic import reserve_output_path, discard_output
+
+try:
+    import resource # POSIX only; limits are skipped elsewhere
+except ImportError:
+    resource = None
+
+FAILED: Tuple[None, None, None] = (None, None, None)
+
+
+def _current_rss_bytes() -> int:
+    """Resident set size of this process right now (peak RSS if unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024 # bytes on macOS, KiB on Linux
+
+
+def _worker_main(conn, memory_limit_bytes: Optional[int]) -> None:
+    """
+    Runs in the worker process: applies the memory limit once, then serves
+    (kind, input_path, options, cpu_seconds, report_progress) jobs from
+    `conn` until it receives None or the pipe closes.
+    """
+    if resource is not None and memory_limit_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+
+    from compressor_logic import compress_pdf, compress_image, warmup
+    warmup()
+    compress_funcs = {"pdf": compress_pdf, "image": compress_image}
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        kind, input_path, options, cpu_seconds, report_progress = job
+
+        if resource is not None and cpu_seconds:
+            # RLIMIT_CPU counts the whole process, so each job gets a budget on
+            # top of what the worker has used so far. Going over it raises
+            # SIGXCPU, which terminates the worker.
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+        progress_callback = None
+        if report_progress:
+            progress_callback = lambda percent, message: conn.send(("progress", percent, message))
+
+        try:
+            result = compress_funcs[kind](input_path, options, progress_callback=progress_callback)
+        except MemoryError:
+            print(f"Worker ran out of memory compressing {input_path}")
+            result = FAILED
+        conn.send(("result", result, _current_rss_bytes()))
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.jobs_done = 0
+
+
+class CompressionService:
+    """
+    Runs compress_pdf/compress_image in a pool of isolated worker processes.
+
+    - Each worker is recycled after `max_jobs_per_worker` jobs or once its RSS
+      exceeds `max_rss_bytes`, so slow leaks in Pillow/pikepdf don't build up.
+    - Each job gets `job_cpu_seconds` of CPU time (RLIMIT_CPU) and runs in a
+      process capped at `job_memory_bytes` of address space (RLIMIT_AS).
+    - A job still running after `job_timeout` seconds has its worker killed.
+    - A worker whose job failed is replaced too.
+    Failed, killed and over-limit jobs return (None, None, None), just like a
+    failed in-process compression. compress() may be called from many
+    threads; at most `workers` jobs run at once and the rest wait.
+    """
+    def __init__(
+        self,
+        workers: int = 2,
+        max_jobs_per_worker: int = 50,
+        max_rss_bytes: Optional[int] = 1024 ** 3,
+        job_timeout: float = 300,
+        job_cpu_seconds: Optional[int] = 240,
+        job_memory_bytes: Optional[int] = 3 * 1024 ** 3
+    ):
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_rss_bytes = max_rss_bytes
+        self.job_timeout = job_timeout
+        self.job_cpu_seconds = job_cpu_seconds
+        self.job_memory_bytes = job_memory_bytes
+
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            # Workers fork from a small server process that has the codecs
+            # preloaded, rather than from this (possibly threaded) process
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload(["compressor_logic", "PIL.Image", "pikepdf"])
+        else:
+            self._context = multiprocessing.get_context("spawn")
+
+        # One slot per worker; None means the slot's process must be (re)started
+        self._slots: "queue.Queue[Optional[_Worker]]" = queue.Queue()
+        for _ in range(workers):
+            self._slots.put(None)
+        self._stats_lock = threading.Lock()
+        self._stats = {"jobs": 0, "failed": 0, "killed": 0, "recycled": 0, "started": 0}
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.job_memory_bytes),
+            name="compression-worker",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._count("started")
+        return _Worker(process, parent_conn)
+
+    def _kill(self, worker: _Worker) -> None:
+        worker.process.kill()
+        worker.process.join()
+        worker.conn.close()
+
+    def _retire(self, worker: _Worker, recycled: bool = True) -> None:
+        try:
+            worker.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        worker.process.join(5)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        worker.conn.close()
+        if recycled:
+            self._count("recycled")
+
+    def _lost(self, worker: _Worker, input_path: str, output_path: str) -> None:
+        # The worker died or its pipe broke: CPU limit (SIGXCPU), a crash in
+        # native code, MemoryError during startup, ...
+        worker.process.join(5)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        print(f"Compression worker exited with code {worker.process.exitcode} while processing {input_path}.")
+        worker.conn.close()
+        self._count("failed")
+        discard_output(output_path)
+
+    def compress(
+        self,
+        kind: str,
+        input_path: str,
+        options: Dict[str, Any],
+        progress_callback: Optional[Callable[[float, str], None]] = None
+    ) -> Tuple[Optional[int], Optional[int], Optional[str]]:
+        """
+        Compresses `input_path` in a worker. `kind` is "pdf" or "image".
+        Returns the same tuple as compress_pdf/compress_image.
+        """
+        # Reserved here so a partial file can be removed if the worker is killed
+        output_path = reserve_output_path(input_path)
+        options = dict(options, output_path=os.path.abspath(output_path))
+
+        worker = self._slots.get()
+        try:
+            if worker is not None and not worker.process.is_alive():
+                worker.conn.close() # Died while idle
+                worker = None
+            if worker is None:
+                worker = self._spawn()
+            self._count("jobs")
+            job = (kind, os.path.abspath(input_path), options, self.job_cpu_seconds, progress_callback is not None)
+            try:
+                worker.conn.send(job)
+            except (EOFError, OSError):
+                self._lost(worker, input_path, output_path)
+                worker = None
+                return FAILED
+
+            deadline = time.monotonic() + self.job_timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not worker.conn.poll(remaining):
+                    print(f"Compression of {input_path} timed out after {self.job_timeout}s; killing worker.")
+                    self._kill(worker)
+                    worker = None
+                    self._count("killed")
+                    discard_output(output_path)
+                    return FAILED
+                try:
+                    message = worker.conn.recv()
+                except (EOFError, OSError):
+                    self._lost(worker, input_path, output_path)
+                    worker = None
+                    return FAILED
+
+                if message[0] == "progress":
+                    progress_callback(message[1], message[2])
+                    continue
+
+                _, result, rss_bytes = message
+                worker.jobs_done += 1
+                failed = result[2] is None
+                if failed:
+                    self._count("failed")
+                # A failed job may have hit the memory limit or left native
+                # state behind, so its worker is replaced as well
+                if failed or worker.jobs_done >= self.max_jobs_per_worker or \
+                        (self.max_rss_bytes and rss_bytes > self.max_rss_bytes):
+                    self._retire(worker)
+                    worker = None
+                return result
+        finally:
+            self._slots.put(worker)
+
+    def stop(self) -> None:
+        """Stops all idle workers. Jobs still running finish first."""
+        while True:
+            try:
+                worker = self._slots.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                self._retire(worker, recycled=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
@@ -1,22 +1,180 @@
 # universal_file_compressor/compressor_logic.py
 import os
 import io
-from typing import Optional, Tuple, Callable, Dict, Any
-from PIL import Image, ImageChops, UnidentifiedImageError # Added UnidentifiedImageError
-import pikepdf
-from utils import OUTPUT_FOLDER
+import struct
+import zlib
+from typing import Optional, Tuple, Callable, Dict, Any, Iterable, Iterator, BinaryIO, TYPE_CHECKING
+from utils import OUTPUT_FOLDER, create_output_folder, reserve_unique_path
+from pdf_presets import (
+    NEUTRAL_COLORFULNESS, get_preset, get_image_features, classify_image,
+    find_image_placements, effective_dpi
+)
+
+# Pillow and pikepdf are imported inside the functions that need them, so that
+# importing this module stays cheap: an image job never loads pikepdf, and the
+# web/CLI entry points start without paying for either codec up front.
+if TYPE_CHECKING:
+    import pikepdf
+    from PIL import Image
+
+
+# --- Warmup ---
+def warmup(file_types: Iterable[str] = ("pdf", "image")) -> None:
+    """
+    Eagerly imports the codec modules for the given file types.
+    Meant to be called once in a pre-fork server master (see gunicorn.conf.py)
+    so every forked worker shares the already-loaded code pages copy-on-write.
+    """
+    file_types = set(file_types)
+    if "pdf" in file_types or "image" in file_types:
+        from PIL import Image, ImageChops  # noqa: F401
+        Image.preinit() # Registers the JPEG/PNG plugins
+    if "pdf" in file_types:
+        import pikepdf  # noqa: F401
+
+
+def reserve_output_path(input_path: str) -> str:
+    """Reserves a collision-free output path for `input_path` in OUTPUT_FOLDER."""
+    return reserve_unique_path(create_output_folder(OUTPUT_FOLDER), f"compressed_{os.path.basename(input_path)}")
+
+
+def discard_output(output_path: str) -> None:
+    """Removes a reserved or partially written output file after a failure."""
+    if os.path.exists(output_path):
+        try:
+            os.remove(output_path)
+        except OSError: # e.g. file in use
+            print(f"Could not remove partially written file: {output_path}")
+
 
 # --- PDF Compression ---
+# Source filters whose data a lossless re-encode will practically never beat
+_LOSSY_PDF_FILTERS = ('/DCTDecode', '/JPXDecode')
+
+
+def _must_keep_image(img_xobj: "pikepdf.Stream") -> bool:
+    # Stencil masks, colour-key masks and /Decode arrays don't survive a
+    # change of colour space or codec, so such images are left alone
+    return bool(img_xobj.get('/ImageMask', False)) or '/Mask' in img_xobj or '/Decode' in img_xobj
+
+
+def _is_gray(pil_image: "Image.Image") -> bool:
+    # True if every pixel of an RGB image has R == G == B
+    from PIL import ImageChops
+
+    r, g, b = pil_image.split()
+    return ImageChops.difference(r, g).getbbox() is None and ImageChops.difference(g, b).getbbox() is None
+
+
+def _apply_preset_rule(
+    img_xobj: "pikepdf.Stream",
+    rules: Dict[str, Dict[str, Any]],
+    placement: Optional[Dict[str, float]]
+) -> Optional[str]:
+    """
+    Classifies one image and re-encodes it according to its class's rule.
+    The image is only decoded if the rule needs its pixels, so images kept
+    on a classification cache hit cost no more than hashing their data.
+    Returns the class if the image was replaced, None if it was kept.
+    """
+    import pikepdf
+    from PIL import Image
+
+    if _must_keep_image(img_xobj):
+        return None
+
+    decoded = []
+    def load_pil_image():
+        if not decoded:
+            decoded.append(pikepdf.PdfImage(img_xobj).as_pil_image())
+        return decoded[0]
+
+    pixel_size = (int(img_xobj.Width), int(img_xobj.Height))
+    features = get_image_features(img_xobj, load_pil_image)
+    image_class = classify_image(features, pixel_size, placement)
+    rule = rules[image_class]
+    if rule["codec"] == "keep":
+        return None
+    source_filter = img_xobj.get('/Filter')
+    if isinstance(source_filter, pikepdf.Array):
+        source_filter = source_filter[-1] if len(source_filter) else None
+    if rule["codec"] == "flate" and image_class != "bilevel" and str(source_filter) in _LOSSY_PDF_FILTERS:
+        return None
+
+    pil_image = load_pil_image()
+    if pil_image.mode not in ('1', 'L', 'LA', 'RGB'):
+        pil_image = pil_image.convert('RGB')
+
+    # Dropping colour is lossy, so colour images only become grey if the rule
+    # allows it (thresholding or "grayscale" on a near-neutral image) or if
+    # every pixel already is grey. Colorfulness alone won't do for the latter:
+    # it is measured on a thumbnail, and thin coloured lines can escape it.
+    neutral = features["colorfulness"] < NEUTRAL_COLORFULNESS
+    if pil_image.mode != 'RGB' or (image_class == "bilevel" and rule.get("binarize")) or \
+            (neutral and (rule.get("grayscale") or _is_gray(pil_image))):
+        pil_image = pil_image.convert('L')
+
+    dpi = effective_dpi(pil_image.size, placement)
+    max_dpi = rule.get("max_dpi")
+    if dpi and max_dpi and dpi > max_dpi * 1.1: # Small overshoots aren't worth a resample
+        scale = max_dpi / dpi
+        pil_image = pil_image.resize(
+            (max(1, round(pil_image.width * scale)), max(1, round(pil_image.height * scale))),
+            Image.Resampling.LANCZOS
+        )
+
+    bits_per_component = 8
+    if rule["codec"] == "jpeg":
+        img_byte_arr = io.BytesIO()
+        pil_image.save(img_byte_arr, format='JPEG', quality=rule.get("quality", 75), optimize=True, progressive=True)
+        img_bytes = img_byte_arr.getvalue()
+        pdf_filter = pikepdf.Name.DCTDecode
+    else:
+        if image_class == "bilevel" and pil_image.mode == 'L':
+            # Thresholding to 1 bit is lossy unless the image is already pure
+            # black and white, so without "binarize" other greys stay 8-bit
+            binarize = rule.get("binarize", False)
+            if not binarize:
+                colors = pil_image.getcolors(2)
+                binarize = colors is not None and all(value in (0, 255) for _, value in colors)
+            if binarize:
+                pil_image = pil_image.convert('1', dither=Image.Dither.NONE)
+                bits_per_component = 1
+        img_bytes = zlib.compress(pil_image.tobytes(), 9)
+        pdf_filter = pikepdf.Name.FlateDecode
+
+    if len(img_bytes) >= len(img_xobj.read_raw_bytes()):
+        return None
+
+    img_xobj.write(img_bytes, filter=pdf_filter)
+    img_xobj.Width = pil_image.width
+    img_xobj.Height = pil_image.height
+    img_xobj.ColorSpace = pikepdf.Name.DeviceRGB if pil_image.mode == 'RGB' else pikepdf.Name.DeviceGray
+    img_xobj.BitsPerComponent = bits_per_component
+    return image_class
+
+
 def recompress_pdf_images(
-    pdf: pikepdf.Pdf,
+    pdf: "pikepdf.Pdf",
     image_quality: int = 75,
-    progress_callback: Optional[Callable[[float, str], None]] = None
+    progress_callback: Optional[Callable[[float, str], None]] = None,
+    preset: Optional[str] = None
 ) -> int:
     """
     Iterates through images in a PDF, re-compresses them as JPEGs.
+    With a named preset (see pdf_presets.PRESETS), each image is instead
+    classified and handled by that preset's rule for its class, and
+    image_quality is ignored.
     Modifies the Pdf object in place.
     Returns the number of images processed.
     """
+    import pikepdf
+    from PIL import Image, ImageChops, UnidentifiedImageError
+
+    rules = get_preset(preset) if preset else None
+    placements = find_image_placements(pdf) if rules else {}
+    class_counts: Dict[str, int] = {}
+
     images_processed = 0
     
     # --- More robust image identification and counting ---
@@ -43,7 +201,17 @@ def recompress_pdf_images(
             )
         
         try:
-            pikepdf_image = pikepdf.Image(img_xobj) # Pass the XObject stream directly
+            if rules:
+                image_class = _apply_preset_rule(img_xobj, rules, placements.get(img_xobj.objgen))
+                if image_class:
+                    class_counts[image_class] = class_counts.get(image_class, 0) + 1
+                    images_processed += 1
+                continue
+
+            if _must_keep_image(img_xobj):
+                continue
+
+            pikepdf_image = pikepdf.PdfImage(img_xobj) # Pass the XObject stream directly
             pil_image = pikepdf_image.as_pil_image()
 
             has_alpha = False
@@ -66,14 +234,16 @@ def recompress_pdf_images(
             img_byte_arr = io.BytesIO()
             pil_image.save(img_byte_arr, format='JPEG', quality=image_quality, optimize=True, progressive=True)
             img_bytes = img_byte_arr.getvalue()
+            if len(img_bytes) >= len(img_xobj.read_raw_bytes()):
+                continue # JPEG would not be smaller (e.g. a 1-bit or flat image)
 
-            # Replace the image stream data in the original XObject
-            img_xobj.stream_data = img_bytes
-            img_xobj.Filter = pikepdf.Name.DCTDecode # Standard filter for JPEG
+            # Replace the image stream data in the original XObject; write()
+            # also drops any DecodeParms that belonged to the old filter
+            img_xobj.write(img_bytes, filter=pikepdf.Name.DCTDecode) # Standard filter for JPEG
+            img_xobj.ColorSpace = pikepdf.Name.DeviceRGB if pil_image.mode == 'RGB' else pikepdf.Name.DeviceGray
+            img_xobj.BitsPerComponent = 8
             
-            # Clear out potentially incompatible decode parameters and masks
-            if hasattr(img_xobj, 'DecodeParms'): # Use hasattr for safety
-                del img_xobj.DecodeParms
+            # Clear out potentially incompatible masks
             if hasattr(img_xobj, 'SMask') and has_alpha: # Only remove Smask if alpha was flattened
                 del img_xobj.SMask
             # Consider /Mask as well if it exists and becomes incompatible
@@ -88,6 +258,8 @@ def recompress_pdf_images(
             print(f"Skipping image {getattr(img_xobj, 'objgen', 'unknown')} due to general error: {e}")
             import traceback
             traceback.print_exc()
+    if class_counts:
+        print("Re-compressed images by class: " + ", ".join(f"{k}={v}" for k, v in sorted(class_counts.items())))
     return images_processed
 
 
@@ -101,11 +273,14 @@ def compress_pdf(
     options: {
         "recompress_images": bool,
         "image_quality": int (1-95),
-        "linearize": bool
+        "linearize": bool,
+        "preset": Optional[str] ("screen", "ebook", "print", "archive"; overrides image_quality),
+        "output_path": Optional[str] (already reserved with reserve_output_path)
     }
     """
-    filename = os.path.basename(input_path)
-    output_path = os.path.join(OUTPUT_FOLDER, f"compressed_{filename}")
+    import pikepdf
+
+    output_path = options.get("output_path") or reserve_output_path(input_path)
 
     try:
         original_size = os.path.getsize(input_path)
@@ -115,7 +290,7 @@ def compress_pdf(
 
         pdf = pikepdf.Pdf.open(input_path, allow_overwriting_input=False)
 
-        if options.get("recompress_images", False):
+        if options.get("recompress_images", False) or options.get("preset"):
             if progress_callback:
                 progress_callback(5, "Starting image re-compression...") # Adjusted start %
             
@@ -127,7 +302,8 @@ def compress_pdf(
             num_recompressed = recompress_pdf_images(
                 pdf,
                 options.get("image_quality", 75),
-                image_progress_wrapper
+                image_progress_wrapper,
+                preset=options.get("preset")
             )
             print(f"Re-compressed {num_recompressed} images in PDF.")
             if progress_callback:
@@ -155,13 +331,366 @@ def compress_pdf(
         print(f"Error compressing PDF {input_path}: {e}")
         import traceback
         traceback.print_exc()
-        if os.path.exists(output_path):
-             try:
-                os.remove(output_path)
-             except OSError: # e.g. file in use
-                print(f"Could not remove partially written file: {output_path}")
+        discard_output(output_path)
         return None, None, None
 
+
+# --- Streaming (strip-based) Image Compression ---
+# Images above this many pixels are compressed strip by strip unless the
+# caller sets options["streaming"] explicitly
+STREAMING_PIXEL_THRESHOLD = 64_000_000 # ~8k x 8k
+# Cap for PNGs past Pillow's decompression-bomb limit (~34k x 34k). Those are
+# only accepted with options["streaming"] = True, and only if their rows can
+# be decoded strip by strip (see _png_rows_readable).
+STREAMING_MAX_PIXELS = 1_200_000_000
+STREAMING_STRIP_HEIGHT = 256
+
+# PNG colour type and bit depth for each mode written by the streaming encoder
+_PNG_COLOR_TYPES = {"1": (0, 1), "L": (0, 8), "RGB": (2, 8), "P": (3, 8), "LA": (4, 8), "RGBA": (6, 8)}
+# Modes the streaming encoder converts (per strip) before writing
+_STREAMING_MODE_MAP = {"CMYK": "RGB", "YCbCr": "RGB", "LAB": "RGB", "HSV": "RGB", "PA": "RGBA", "La": "LA", "RGBa": "RGBA"}
+# Most compressed IDAT data read from the file at once
+_PNG_READ_BLOCK_SIZE = 1024 * 1024
+
+
+def _png_rows_readable(img) -> bool:
+    """
+    Whether _read_png_strips can decode this (not yet loaded) image: a
+    non-interlaced PNG whose scanlines Pillow stores unchanged, i.e. 1-bit
+    grey or 8-bit L, LA, RGB, RGBA or P.
+    """
+    return img.format == "PNG" and not img.info.get("interlace") and len(img.tile) == 1 \
+        and img.tile[0][0] == "zip" and img.tile[0][3] == img.mode and img.mode in _PNG_COLOR_TYPES
+
+
+def _iter_png_idat(f: BinaryIO) -> Iterator[bytes]:
+    # Yields the concatenated IDAT payload in blocks, skipping other chunks
+    f.seek(8) # PNG signature
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type == b"IEND":
+            return
+        if chunk_type != b"IDAT":
+            f.seek(length + 4, os.SEEK_CUR) # Data and CRC
+            continue
+        while length:
+            block = f.read(min(length, _PNG_READ_BLOCK_SIZE))
+            if not block:
+                return
+            length -= len(block)
+            yield block
+        f.seek(4, os.SEEK_CUR) # CRC
+
+
+def _read_png_strips(input_path: str, img, strip_height: int):
+    """
+    Decodes a PNG strip by strip without ever holding the whole image,
+    yielding (top, strip) pairs. The IDAT stream is inflated incrementally
+    (at most one strip of rows at a time), and each strip's rows are
+    unfiltered by Pillow's own PNG decoder. Because Up/Average/Paeth refer to
+    the row above, the previous strip's last row is passed in front of each
+    strip as an unfiltered scanline and cropped off again.
+    """
+    from PIL import Image
+
+    width, height = img.size
+    mode = img.mode
+    row_bytes = (width + 7) // 8 if mode == '1' else width * len(img.getbands())
+    stride = row_bytes + 1 # Each scanline starts with its filter type
+    inflater = zlib.decompressobj()
+    pending = bytearray()
+    previous_row = b""
+    top = 0
+
+    with open(input_path, "rb") as f:
+        for data in _iter_png_idat(f):
+            while data and top < height:
+                # Bounded, so a small, highly compressed file can't expand at once
+                pending += inflater.decompress(data, stride * strip_height)
+                data = inflater.unconsumed_tail
+                while top < height and len(pending) >= stride * min(strip_height, height - top):
+                    rows = min(strip_height, height - top)
+                    scanlines = previous_row + bytes(pending[:stride * rows])
+                    del pending[:stride * rows]
+                    strip = Image.frombytes(
+                        mode, (width, rows + (1 if previous_row else 0)),
+                        zlib.compress(scanlines, 0), "zip", mode
+                    )
+                    if previous_row:
+                        strip = strip.crop((0, 1, width, strip.height))
+                    previous_row = b"\0" + strip.crop((0, rows - 1, width, rows)).tobytes()
+                    yield top, strip
+                    top += rows
+            if top >= height:
+                return
+    raise ValueError(f"PNG image data is truncated ({top} of {height} rows).")
+
+
+def _source_strips(img, input_path: str, strip_height: int):
+    """
+    Yields (top, strip) pairs of the source image: read row by row for PNGs
+    _png_rows_readable accepts, otherwise cropped from the decoded image.
+    """
+    if _png_rows_readable(img):
+        yield from _read_png_strips(input_path, img, strip_height)
+        return
+    width, height = img.size
+    for top in range(0, height, strip_height):
+        yield top, img.crop((0, top, width, min(top + strip_height, height)))
+
+
+def _open_image(input_path: str, allow_oversized_png: bool):
+    """
+    Image.open with Pillow's decompression-bomb guard in place. With
+    `allow_oversized_png`, a PNG over that limit is opened anyway if its rows
+    can be streamed (and it is within STREAMING_MAX_PIXELS); the caller must
+    then compress it with the strip encoder.
+    """
+    from PIL import Image, PngImagePlugin
+
+    try:
+        return Image.open(input_path)
+    except Image.DecompressionBombError as bomb_error:
+        if not allow_oversized_png:
+            raise
+        try:
+            # The plugin class on its own skips Image.open's bomb check, so
+            # the global MAX_IMAGE_PIXELS is left alone
+            img = PngImagePlugin.PngImageFile(input_path)
+        except SyntaxError: # Not a PNG
+            raise bomb_error from None
+        if _png_rows_readable(img) and img.width * img.height <= STREAMING_MAX_PIXELS:
+            return img
+        img.close()
+        raise
+
+
+def _needs_strip_processing(img, ext: str, options: Dict[str, Any]) -> bool:
+    """
+    Whether the streaming encoder saves memory over Pillow's own encoder:
+    - PNGs whose rows can be read strip by strip are never decoded whole.
+    - Other PNGs only when a mode conversion or quantization would
+      otherwise build a full-size copy.
+    - JPEGs only on explicit request (options["streaming"] = True) and only
+      for RGB/L sources, which are then written baseline.
+    """
+    if ext in ('.jpg', '.jpeg'):
+        return options.get("streaming") is True and img.mode in ('RGB', 'L')
+    if ext != '.png':
+        return False
+    mode = _STREAMING_MODE_MAP.get(img.mode, img.mode)
+    if mode not in _PNG_COLOR_TYPES:
+        return False
+    if options.get("png_quantize", False):
+        # Other modes are quantized properly by the regular path
+        return mode in ('RGB', 'L')
+    return _png_rows_readable(img) or mode != img.mode
+
+
+def _iter_strips(img, strips, mode: str):
+    """
+    Converts each (top, strip) pair from `strips` to `mode`. Alpha is
+    flattened onto white when converting to RGB/L, as in the regular JPEG
+    path. Only one strip is converted at a time.
+    """
+    from PIL import Image
+
+    for top, strip in strips:
+        if strip.mode != mode:
+            has_alpha = strip.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La') \
+                or (strip.mode == 'P' and 'transparency' in img.info)
+            if has_alpha and mode in ('RGB', 'L'):
+                rgba = strip.convert('RGBA')
+                flattened = Image.new('RGB', strip.size, (255, 255, 255))
+                flattened.paste(rgba, mask=rgba.getchannel('A'))
+                strip = flattened if mode == 'RGB' else flattened.convert(mode)
+            else:
+                strip = strip.convert(mode)
+        yield top, strip
+
+
+def _png_chunk(f, chunk_type: bytes, data: bytes) -> None:
+    f.write(struct.pack(">I", len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+
+def _filter_png_strip(strip, previous_row) -> bytes:
+    """
+    Returns the strip's scanlines with PNG filters applied, chosen per row by
+    Pillow's encoder (which filters into an uncompressed PNG in memory).
+    `previous_row`, the last row of the previous strip, is encoded in front
+    so the first row is filtered against it, and then dropped.
+    """
+    from PIL import Image
+
+    source = strip
+    if previous_row is not None:
+        source = Image.new(strip.mode, (strip.width, strip.height + 1))
+        source.paste(previous_row, (0, 0))
+        source.paste(strip, (0, 1))
+    buffer = io.BytesIO()
+    # bits=8 stops Pillow from packing palette strips more tightly than the IHDR says
+    source.save(buffer, format="PNG", compress_level=0, **({"bits": 8} if strip.mode == 'P' else {}))
+    scanlines = zlib.decompress(b"".join(_iter_png_idat(buffer)))
+    if previous_row is not None:
+        scanlines = scanlines[len(scanlines) // source.height:]
+    return scanlines
+
+
+def _write_png_streaming(
+    output_path: str,
+    img,
+    mode: str,
+    strips,
+    compress_level: int,
+    palette: Optional[bytes] = None,
+    transparency: Optional[bytes] = None,
+    icc_profile: Optional[bytes] = None,
+    dpi: Optional[Tuple[float, float]] = None,
+    progress_callback: Optional[Callable[[float, str], None]] = None
+) -> None:
+    """
+    Writes a non-interlaced PNG from an iterator of (top, strip) pairs,
+    deflating rows into IDAT chunks as they arrive instead of building the
+    whole output image first. `icc_profile` and `dpi` become iCCP and pHYs
+    chunks, as Pillow's encoder writes them.
+    """
+    width, height = img.size
+    color_type, bit_depth = _PNG_COLOR_TYPES[mode]
+    compressor = zlib.compressobj(compress_level)
+    previous_row = None
+
+    with open(output_path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        _png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0))
+        if icc_profile:
+            _png_chunk(f, b"iCCP", b"ICC Profile\0\0" + zlib.compress(icc_profile))
+        if dpi:
+            _png_chunk(f, b"pHYs", struct.pack(">IIB", int(dpi[0] / 0.0254 + 0.5), int(dpi[1] / 0.0254 + 0.5), 1))
+        if palette is not None:
+            _png_chunk(f, b"PLTE", palette)
+        if transparency is not None:
+            _png_chunk(f, b"tRNS", transparency)
+
+        for top, strip in strips:
+            rows = _filter_png_strip(strip, previous_row)
+            previous_row = strip.crop((0, strip.height - 1, width, strip.height))
+            compressed = compressor.compress(rows)
+            if compressed:
+                _png_chunk(f, b"IDAT", compressed)
+            if progress_callback:
+                progress_callback(20 + 60 * (top + strip.height) / height, f"Encoded rows {top + strip.height}/{height}")
+
+        _png_chunk(f, b"IDAT", compressor.flush())
+        _png_chunk(f, b"IEND", b"")
+
+
+def _png_icc_profile(img, mode: str) -> Optional[bytes]:
+    # Only kept if it still describes the output: a CMYK profile doesn't fit
+    # an image converted to RGB, nor a grey one an image quantized via RGB
+    profile = img.info.get('icc_profile')
+    if not profile or len(profile) < 20:
+        return None
+    expected = b'GRAY' if mode in ('1', 'L', 'LA') else b'RGB '
+    return profile if profile[16:20] == expected else None
+
+
+def _png_transparency(img, mode: str) -> Optional[bytes]:
+    # Carries a palette image's tRNS through unchanged
+    transparency = img.info.get('transparency')
+    if mode != 'P' or img.mode != 'P' or transparency is None:
+        return None
+    if isinstance(transparency, int):
+        return bytes([255] * transparency + [0])
+    return bytes(transparency)
+
+
+def _reduced_copy(img, strips, factor: int):
+    # A copy of the image shrunk by `factor`, assembled from reduced strips
+    from PIL import Image
+
+    reduced = [strip.reduce(factor) if factor > 1 else strip for _, strip in strips]
+    sample = Image.new(reduced[0].mode, (reduced[0].width, sum(r.height for r in reduced)))
+    top = 0
+    for r in reduced:
+        sample.paste(r, (0, top))
+        top += r.height
+    return sample
+
+
+def _compress_image_streaming(
+    img,
+    input_path: str,
+    output_path: str,
+    ext: str,
+    options: Dict[str, Any],
+    progress_callback: Optional[Callable[[float, str], None]] = None
+) -> None:
+    """
+    Compresses an opened image strip by strip (callers check
+    _needs_strip_processing first):
+    - PNG rows are filtered and deflated straight into the output file, and
+      every conversion (alpha flattening, quantization, mode changes) is done
+      per strip. Sources that _png_rows_readable accepts are also decoded
+      strip by strip, so peak memory follows the strip height; others are
+      still decoded into one buffer by Pillow.
+    - JPEG sources are decoded whole by Pillow. The output is written
+      baseline without Huffman optimization, which lets libjpeg encode
+      scanline by scanline instead of buffering the whole image's
+      coefficients, at the cost of a typically 15-20% larger file.
+    """
+    from PIL import Image
+
+    strip_height = max(1, int(options.get("strip_height", STREAMING_STRIP_HEIGHT)))
+
+    if ext in ('.jpg', '.jpeg'):
+        if progress_callback: progress_callback(80, "Saving compressed image...")
+        img.save(output_path, format="JPEG", quality=options.get("jpg_quality", 85),
+                 optimize=False, progressive=False)
+        return
+
+    mode = _STREAMING_MODE_MAP.get(img.mode, img.mode)
+    compress_level = options.get("png_compress_level", 6)
+    palette = None
+
+    if options.get("png_quantize", False) and mode in ('RGB', 'L'):
+        num_colors = options.get("png_quantize_colors", 256)
+        if progress_callback: progress_callback(20, f"Quantizing PNG to {num_colors} colors...")
+        # Build the palette from a reduced copy (one pass over the source),
+        # then map each strip onto it in a second pass
+        factor = max(1, int((img.width * img.height / 4_000_000) ** 0.5))
+        sample = _reduced_copy(img, _source_strips(img, input_path, strip_height), factor)
+        palette_img = sample.convert('RGB').quantize(colors=num_colors)
+        del sample
+        palette = bytes(palette_img.getpalette()[:3 * num_colors])
+        strips = (
+            (top, strip.quantize(palette=palette_img, dither=Image.Dither.FLOYDSTEINBERG))
+            for top, strip in _iter_strips(img, _source_strips(img, input_path, strip_height), 'RGB')
+        )
+        mode = 'P'
+    else:
+        if options.get("png_quantize", False):
+            print(f"PNG quantization is not supported for {img.mode} images in streaming mode; skipping.")
+        if mode == 'P':
+            # getpalette() would decode the whole image; an unloaded PNG
+            # already holds its PLTE data
+            palette = bytes(img.palette.palette) if _png_rows_readable(img) else bytes(img.getpalette())
+        strips = _iter_strips(img, _source_strips(img, input_path, strip_height), mode)
+
+    _write_png_streaming(
+        output_path, img, mode, strips, compress_level,
+        palette=palette,
+        transparency=_png_transparency(img, mode),
+        icc_profile=_png_icc_profile(img, mode),
+        dpi=img.info.get('dpi'),
+        progress_callback=progress_callback
+    )
+
 # --- Image Compression ---
 def compress_image(
     input_path: str,
@@ -174,19 +703,42 @@ def compress_image(
         "jpg_quality": int (1-95),
         "png_compress_level": int (0-9),
         "png_quantize": bool,
-        "png_quantize_colors": int (2-256)
+        "png_quantize_colors": int (2-256),
+        "streaming": Optional[bool] (None = automatic above STREAMING_PIXEL_THRESHOLD;
+                     True also accepts streamable PNGs up to STREAMING_MAX_PIXELS),
+        "strip_height": int (rows per strip in streaming mode),
+        "output_path": Optional[str] (already reserved with reserve_output_path)
     }
     """
+    from PIL import Image, UnidentifiedImageError
+
     filename = os.path.basename(input_path)
     name, ext = os.path.splitext(filename)
-    output_path = os.path.join(OUTPUT_FOLDER, f"compressed_{name}{ext}")
+    output_path = options.get("output_path") or reserve_output_path(input_path)
 
     try:
         if progress_callback: progress_callback(0, "Loading image...")
         original_size = os.path.getsize(input_path)
-        img = Image.open(input_path)
+        streaming = options.get("streaming")
+        # Only an explicit request may take a PNG past Pillow's decompression-bomb limit
+        img = _open_image(input_path, allow_oversized_png=streaming is True)
         original_mode = img.mode 
 
+        pixels = img.width * img.height
+        # Such a PNG was only opened because its rows can be decoded strip by strip
+        oversized = bool(Image.MAX_IMAGE_PIXELS) and pixels > 2 * Image.MAX_IMAGE_PIXELS
+        if streaming is None:
+            streaming = pixels > STREAMING_PIXEL_THRESHOLD
+        if oversized or (streaming and _needs_strip_processing(img, ext.lower(), options)):
+            if progress_callback: progress_callback(20, "Processing image in strips...")
+            _compress_image_streaming(img, input_path, output_path, ext.lower(), options, progress_callback)
+            img.close()
+            compressed_size = os.path.getsize(output_path)
+            if progress_callback: progress_callback(100, "Image compression complete.")
+            return original_size, compressed_size, output_path
+        # Other images go to Pillow's encoder, which works from the decoded
+        # buffer without a further copy
+
         if progress_callback: progress_callback(20, "Processing image...")
 
         if img.mode == 'RGBA' and ext.lower() in ['.jpg', '.jpeg']:
@@ -237,6 +789,7 @@ def compress_image(
                         print(f"PNG quantization failed: {e}")
         else:
             print(f"Unsupported image format for compression: {ext}")
+            discard_output(output_path)
             return None, None, None
         
         if progress_callback: progress_callback(80, "Saving compressed image...")
@@ -248,17 +801,15 @@ def compress_image(
 
     except FileNotFoundError:
         print(f"Error: Input file not found at {input_path}")
+        discard_output(output_path)
         return None, None, None
     except UnidentifiedImageError: 
         print(f"Error: Cannot identify image file. It might be corrupted or an unsupported format: {input_path}")
+        discard_output(output_path)
         return None, None, None
     except Exception as e:
         print(f"Error compressing image {input_path}: {e}")
         import traceback
         traceback.print_exc()
-        if os.path.exists(output_path):
-            try:
-                os.remove(output_path)
-            except OSError:
-                print(f"Could not remove partially written file: {output_path}")
+        discard_output(output_path)
         return None, None, None
\ No newline at end of file
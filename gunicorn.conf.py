@@ -0,0 +1,46 @@
+# universal_file_compressor/gunicorn.conf.py
+# Usage: COMPRESSION_WORKERS=2 gunicorn -c gunicorn.conf.py app:app
+# With COMPRESSION_WORKERS set, each web worker hands compression to its own
+# pool of recycled, resource-limited processes (see compression_service.py),
+# so web workers stay small and can use threads for concurrent requests.
+import gc
+import multiprocessing
+
+bind = "0.0.0.0:8000"
+workers = multiprocessing.cpu_count() + 1
+worker_class = "gthread"
+threads = 4
+timeout = 330 # Slightly above JOB_TIMEOUT_SECONDS so the job limit fires first
+
+# Recycle web workers too, staggered so they don't all restart at once
+max_requests = 1000
+max_requests_jitter = 100
+
+# Load the app once in the master so workers are forked from a warm process
+preload_app = True
+
+
+def on_starting(server):
+    # Import Pillow/pikepdf in the master before any worker is forked, so each
+    # worker starts fast and shares the loaded code pages copy-on-write
+    from compressor_logic import warmup
+    warmup()
+
+
+def when_ready(server):
+    # One janitor for the whole server: it runs in the master and workers send
+    # it their register()/discard() calls, so TTLs and quotas cover every
+    # worker's files without listing the folders on each sweep
+    from app import start_janitor
+    start_janitor(shared=True)
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the GC's reach; otherwise the first
+    # collection in each worker touches (and un-shares) those pages
+    gc.freeze()
+
+
+def on_exit(server):
+    from app import janitor
+    janitor.stop()
@@ -7,9 +7,9 @@ import queue # For thread communication
 import webbrowser
 from typing import Optional, Dict, Any
 
-# Ensure OUTPUT_FOLDER is imported from utils so it's initialized
 from utils import get_formatted_size, OUTPUT_FOLDER
 from compressor_logic import compress_pdf, compress_image
+from pdf_presets import PRESETS
 
 
 class FileCompressorApp:
@@ -61,6 +61,7 @@ class FileCompressorApp:
         self.pdf_recompress_images_var = tk.BooleanVar(value=True)
         self.pdf_image_quality_var = tk.IntVar(value=75)
         self.pdf_linearize_var = tk.BooleanVar(value=True)
+        self.pdf_preset_var = tk.StringVar(value="Custom")
 
         ttk.Checkbutton(self.pdf_options_frame, text="Re-compress Images in PDF", variable=self.pdf_recompress_images_var, command=self._toggle_pdf_image_quality_slider).grid(row=0, column=0, sticky=tk.W, columnspan=2)
         self.pdf_image_quality_label = ttk.Label(self.pdf_options_frame, text="Image Quality (for PDF images):")
@@ -71,6 +72,8 @@ class FileCompressorApp:
         self.pdf_image_quality_value_label.grid(row=1, column=2, sticky=tk.W)
         self.pdf_image_quality_var.trace_add("write", lambda *args: self.pdf_image_quality_value_label.config(text=f"{self.pdf_image_quality_var.get()}"))
         ttk.Checkbutton(self.pdf_options_frame, text="Linearize PDF (for faster web view)", variable=self.pdf_linearize_var).grid(row=2, column=0, sticky=tk.W, columnspan=2)
+        ttk.Label(self.pdf_options_frame, text="Preset (overrides image quality):").grid(row=3, column=0, sticky=tk.W, pady=(10,0))
+        ttk.Combobox(self.pdf_options_frame, textvariable=self.pdf_preset_var, values=["Custom"] + list(PRESETS), state="readonly", width=10).grid(row=3, column=1, sticky=tk.W, padx=5, pady=(10,0))
         
         # --- Image Options (initially hidden) ---
         self.image_options_frame = ttk.Frame(self.options_frame)
@@ -250,7 +253,8 @@ class FileCompressorApp:
             options = {
                 "recompress_images": self.pdf_recompress_images_var.get(),
                 "image_quality": self.pdf_image_quality_var.get(),
-                "linearize": self.pdf_linearize_var.get()
+                "linearize": self.pdf_linearize_var.get(),
+                "preset": self.pdf_preset_var.get() if self.pdf_preset_var.get() in PRESETS else None
             }
             target_func = compress_pdf
         elif self.file_type == "image":
@@ -0,0 +1,267 @@
+# universal_file_compressor/pdf_presets.py
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pikepdf
+    from PIL import Image
+
+# Per-class rules for each preset:
+#   "codec": "jpeg" (lossy), "flate" (lossless) or "keep" (leave the image alone)
+#   "quality": JPEG quality
+#   "max_dpi": downsample images displayed above this resolution (None = never)
+#   "grayscale": store colour-neutral images as DeviceGray
+#   "binarize": threshold bilevel images to 1 bit even if they have some grey
+#               (otherwise only pure black-and-white images are stored as 1 bit)
+# Whatever the rule, an image is only replaced if the result is smaller.
+PRESETS: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "screen": {
+        "photo":   {"codec": "jpeg", "quality": 50, "max_dpi": 96, "grayscale": True},
+        "scan":    {"codec": "jpeg", "quality": 45, "max_dpi": 150, "grayscale": True},
+        "bilevel": {"codec": "flate", "max_dpi": 200, "binarize": True},
+        "graphic": {"codec": "flate", "max_dpi": 150},
+        "small":   {"codec": "keep"},
+    },
+    "ebook": {
+        "photo":   {"codec": "jpeg", "quality": 65, "max_dpi": 150, "grayscale": True},
+        "scan":    {"codec": "jpeg", "quality": 55, "max_dpi": 200, "grayscale": True},
+        "bilevel": {"codec": "flate", "max_dpi": 300, "binarize": True},
+        "graphic": {"codec": "flate", "max_dpi": 200},
+        "small":   {"codec": "keep"},
+    },
+    "print": {
+        "photo":   {"codec": "jpeg", "quality": 85, "max_dpi": 300},
+        "scan":    {"codec": "jpeg", "quality": 75, "max_dpi": 300},
+        "bilevel": {"codec": "flate", "max_dpi": 600, "binarize": True},
+        "graphic": {"codec": "flate", "max_dpi": None},
+        "small":   {"codec": "keep"},
+    },
+    "archive": { # Lossless only, full resolution
+        "photo":   {"codec": "flate", "max_dpi": None},
+        "scan":    {"codec": "flate", "max_dpi": None},
+        "bilevel": {"codec": "flate", "max_dpi": None},
+        "graphic": {"codec": "flate", "max_dpi": None},
+        "small":   {"codec": "keep"},
+    },
+}
+
+# Classification thresholds
+BILEVEL_RATIO = 0.97          # share of near-black/near-white pixels
+GRAPHIC_MAX_COLORS = 64       # distinct colours in the thumbnail
+GRAPHIC_MAX_ENTROPY = 3.0     # bits, grey-level histogram
+NEUTRAL_COLORFULNESS = 10.0   # below this an image is treated as greyscale
+SCAN_PAGE_COVERAGE = 0.8      # share of the page covered by the image
+SMALL_MAX_PIXELS = 64 * 64
+SMALL_MAX_AREA_PT = 36 * 36   # half an inch square
+
+FEATURE_THUMBNAIL_SIZE = 256
+FEATURE_CACHE_SIZE = 4096
+
+# Image dictionary entries that change how the same stream data decodes
+_FEATURE_KEY_ENTRIES = ('/Width', '/Height', '/BitsPerComponent', '/ColorSpace', '/Filter', '/DecodeParms')
+
+_feature_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_feature_cache_lock = threading.Lock()
+
+
+def get_preset(name: str) -> Dict[str, Dict[str, Any]]:
+    """Returns the per-class rules of a named preset."""
+    try:
+        return PRESETS[name]
+    except KeyError:
+        raise ValueError(f"Unknown PDF preset '{name}'. Choose from: {', '.join(PRESETS)}")
+
+
+# --- Image features ---
+def compute_image_features(pil_image: "Image.Image") -> Dict[str, Any]:
+    """
+    Cheap content features measured on a small point-sampled thumbnail:
+    colorfulness (Hasler & Suesstrunk), grey-level entropy, bilevel ratio and
+    the number of distinct colours (None if more than GRAPHIC_MAX_COLORS).
+    """
+    from PIL import Image, ImageChops, ImageStat
+
+    if pil_image.mode == '1':
+        return {"colorfulness": 0.0, "entropy": 1.0, "bilevel_ratio": 1.0, "colors": 2}
+
+    # Sampled rather than averaged, so text stays black-on-white and
+    # flat graphics don't pick up anti-aliasing colours
+    scale = FEATURE_THUMBNAIL_SIZE / max(pil_image.size)
+    thumb = pil_image
+    if scale < 1:
+        thumb = pil_image.resize(
+            (max(1, round(pil_image.width * scale)), max(1, round(pil_image.height * scale))),
+            Image.Resampling.NEAREST
+        )
+    thumb = thumb.convert('RGB')
+
+    r, g, b = thumb.split()
+    rg = ImageChops.difference(r, g)
+    yb = ImageChops.difference(ImageChops.add(r, g, scale=2.0), b)
+    rg_stat, yb_stat = ImageStat.Stat(rg), ImageStat.Stat(yb)
+    colorfulness = math.hypot(rg_stat.stddev[0], yb_stat.stddev[0]) \
+        + 0.3 * math.hypot(rg_stat.mean[0], yb_stat.mean[0])
+
+    gray = thumb.convert('L')
+    histogram = gray.histogram()
+    total = sum(histogram) or 1
+    bilevel_ratio = (sum(histogram[:48]) + sum(histogram[208:])) / total
+
+    colors = thumb.getcolors(GRAPHIC_MAX_COLORS)
+    return {
+        "colorfulness": colorfulness,
+        "entropy": gray.entropy(),
+        "bilevel_ratio": bilevel_ratio,
+        "colors": len(colors) if colors is not None else None,
+    }
+
+
+def _describe(obj, depth: int = 0) -> str:
+    # Document-independent text for a PDF object: indirect references are
+    # followed and streams (e.g. ICC profiles) are represented by a digest
+    import pikepdf
+
+    if depth > 8:
+        return "..."
+    if isinstance(obj, pikepdf.Stream):
+        return "stream:" + hashlib.sha256(obj.read_bytes()).hexdigest()
+    if isinstance(obj, pikepdf.Array):
+        return "[" + " ".join(_describe(v, depth + 1) for v in obj) + "]"
+    if isinstance(obj, pikepdf.Dictionary):
+        return "<<" + " ".join(f"{k} {_describe(obj[k], depth + 1)}" for k in sorted(obj.keys())) + ">>"
+    return str(obj)
+
+
+def get_image_features(
+    img_xobj: "pikepdf.Stream",
+    load_pil_image: Callable[[], "Image.Image"]
+) -> Dict[str, Any]:
+    """
+    compute_image_features, cached by the hash of the image's raw stream
+    data and the dictionary entries that affect decoding, so the same image
+    in repeat documents is only analysed once.
+    The image is only decoded (via load_pil_image) on a cache miss.
+    """
+    digest = hashlib.sha256(img_xobj.read_raw_bytes())
+    for name in _FEATURE_KEY_ENTRIES:
+        digest.update(f"{name} {_describe(img_xobj.get(name))}\n".encode())
+    key = digest.hexdigest()
+    with _feature_cache_lock:
+        cached = _feature_cache.get(key)
+        if cached is not None:
+            _feature_cache.move_to_end(key)
+            return cached
+    features = compute_image_features(load_pil_image())
+    with _feature_cache_lock:
+        _feature_cache[key] = features
+        if len(_feature_cache) > FEATURE_CACHE_SIZE:
+            _feature_cache.popitem(last=False)
+    return features
+
+
+def classify_image(features: Dict[str, Any], pixel_size, placement: Optional[Dict[str, float]]) -> str:
+    """Maps features and page placement to one of the preset classes."""
+    width, height = pixel_size
+    if width * height <= SMALL_MAX_PIXELS:
+        return "small"
+    if placement and placement["width_pt"] * placement["height_pt"] <= SMALL_MAX_AREA_PT:
+        return "small"
+    if features["bilevel_ratio"] >= BILEVEL_RATIO:
+        return "bilevel"
+    if features["colors"] is not None or features["entropy"] <= GRAPHIC_MAX_ENTROPY:
+        return "graphic"
+    if placement and placement["page_coverage"] >= SCAN_PAGE_COVERAGE:
+        return "scan"
+    return "photo"
+
+
+# --- Placement ---
+def _multiply(m, n):
+    # PDF matrices are [a b c d e f]; returns m x n
+    a1, b1, c1, d1, e1, f1 = m
+    a2, b2, c2, d2, e2, f2 = n
+    return [
+        a1 * a2 + b1 * c2, a1 * b2 + b1 * d2,
+        c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+        e1 * a2 + f1 * c2 + e2, e1 * b2 + f1 * d2 + f2,
+    ]
+
+
+def _walk_content(pdf_pkg, content, resources, ctm, page_area, placements, depth):
+    xobjects = resources.get('/XObject', {}) if resources is not None else {}
+    stack = []
+    for operands, operator in pdf_pkg.parse_content_stream(content, "q Q cm Do"):
+        op = str(operator)
+        if op == 'q':
+            stack.append(ctm)
+        elif op == 'Q':
+            if stack:
+                ctm = stack.pop()
+        elif op == 'cm':
+            if len(operands) == 6:
+                ctm = _multiply([float(v) for v in operands], ctm)
+        elif op == 'Do':
+            if len(operands) != 1:
+                continue
+            xobj = xobjects.get(operands[0])
+            if xobj is None:
+                continue
+            subtype = xobj.get('/Subtype')
+            if subtype == pdf_pkg.Name.Image:
+                width_pt = math.hypot(ctm[0], ctm[1])
+                height_pt = math.hypot(ctm[2], ctm[3])
+                placement = {
+                    "width_pt": width_pt,
+                    "height_pt": height_pt,
+                    "page_coverage": min(1.0, width_pt * height_pt / page_area) if page_area else 0.0,
+                }
+                # An image drawn several times is judged by its largest use
+                previous = placements.get(xobj.objgen)
+                if previous is None or width_pt * height_pt > previous["width_pt"] * previous["height_pt"]:
+                    placements[xobj.objgen] = placement
+            elif subtype == pdf_pkg.Name.Form and depth < 8:
+                matrix = [float(v) for v in xobj.get('/Matrix', [1, 0, 0, 1, 0, 0])]
+                if len(matrix) != 6:
+                    matrix = [1, 0, 0, 1, 0, 0]
+                _walk_content(pdf_pkg, xobj, xobj.get('/Resources', resources),
+                              _multiply(matrix, ctm), page_area, placements, depth + 1)
+
+
+def find_image_placements(pdf: "pikepdf.Pdf") -> Dict[Any, Dict[str, float]]:
+    """
+    Walks every page's content stream (and nested form XObjects) to find how
+    large each image XObject is drawn. Returns {objgen: {"width_pt",
+    "height_pt", "page_coverage"}}. Images whose placement could not be
+    determined are absent.
+    """
+    import pikepdf
+
+    placements: Dict[Any, Dict[str, float]] = {}
+    for page in pdf.pages:
+        page_placements: Dict[Any, Dict[str, float]] = {}
+        try:
+            x0, y0, x1, y1 = [float(v) for v in page.mediabox]
+            page_area = abs((x1 - x0) * (y1 - y0))
+            _walk_content(pikepdf, page, page.resources, [1, 0, 0, 1, 0, 0],
+                          page_area, page_placements, 0)
+        except Exception as e:
+            # A malformed page only loses its own placements (its images are
+            # then classified without them); it doesn't fail the document
+            print(f"Could not analyse page content for image placement: {e}")
+            continue
+        for objgen, placement in page_placements.items():
+            previous = placements.get(objgen)
+            if previous is None or placement["width_pt"] * placement["height_pt"] > previous["width_pt"] * previous["height_pt"]:
+                placements[objgen] = placement
+    return placements
+
+
+def effective_dpi(pixel_size, placement: Optional[Dict[str, float]]) -> Optional[float]:
+    """Resolution an image is displayed at, or None if unknown."""
+    if not placement or placement["width_pt"] <= 0 or placement["height_pt"] <= 0:
+        return None
+    width, height = pixel_size
+    return min(width / (placement["width_pt"] / 72), height / (placement["height_pt"] / 72))
@@ -0,0 +1,301 @@
+# universal_file_compressor/storage_janitor.py
+import os
+import json
+import time
+import select
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+
+class _FolderIndex:
+    """Files known to live in one folder, kept oldest-first."""
+    def __init__(self, folder: str, ttl_seconds: Optional[float], max_bytes: Optional[int]):
+        self.folder = folder
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[float, int]]" = OrderedDict() # path -> (mtime, size)
+        self.total_bytes = 0
+
+    def add(self, path: str, mtime: float, size: int) -> None:
+        self.remove(path)
+        self.entries[path] = (mtime, size)
+        self.total_bytes += size
+
+    def remove(self, path: str) -> None:
+        entry = self.entries.pop(path, None)
+        if entry:
+            self.total_bytes -= entry[1]
+
+
+class StorageJanitor:
+    """
+    Deletes files from watched folders once they are older than the folder's
+    TTL, and evicts oldest-first while a folder is over its size quota.
+
+    Each folder is scanned once when it is watched; after that the janitor
+    relies on register()/discard() calls from whoever writes and removes
+    files, so sweeps never list the directory. Files it has not been told
+    about are left alone until the next restart.
+
+    To serve several processes (e.g. from the gunicorn master, see
+    gunicorn.conf.py), call share() before forking: processes forked
+    afterwards send their register()/discard() calls to this janitor over a
+    pipe, and their stats() read a snapshot it writes, so one index and one
+    quota cover the whole server without listing the folders again.
+    """
+    def __init__(self, interval_seconds: float = 60):
+        self.interval_seconds = interval_seconds
+        self._indexes: Dict[str, _FolderIndex] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Set by share(): the owning process, its event pipe and stats snapshot
+        self._owner_pid: Optional[int] = None
+        self._events_read: Optional[int] = None
+        self._events_write: Optional[int] = None
+        self._stats_path: Optional[str] = None
+        self._pending = b""
+        self._dirty = False
+        self._stats_written = 0.0
+        if hasattr(os, "register_at_fork"):
+            # A process forked while the sweep thread holds the lock would
+            # inherit it locked forever, so hold it across fork()
+            os.register_at_fork(
+                before=self._lock.acquire,
+                after_in_parent=self._lock.release,
+                after_in_child=self._after_fork_in_child
+            )
+
+    def _after_fork_in_child(self) -> None:
+        self._lock.release()
+        if self._events_read is not None:
+            # Only the owner reads events; dropping the read end also lets a
+            # child's writes fail instead of block if the owner is gone
+            os.close(self._events_read)
+            self._events_read = None
+
+    def _is_remote(self) -> bool:
+        return self._owner_pid is not None and os.getpid() != self._owner_pid
+
+    def share(self) -> None:
+        """Makes this process the janitor for everything it forks from now on."""
+        if self._owner_pid is not None:
+            return
+        self._events_read, self._events_write = os.pipe()
+        os.set_blocking(self._events_read, False)
+        fd, self._stats_path = tempfile.mkstemp(prefix="storage-janitor-", suffix=".json")
+        os.close(fd)
+        self._owner_pid = os.getpid()
+        self._write_stats()
+
+    def _send(self, op: bytes, path: str) -> None:
+        message = op + os.fsencode(path) + b"\n"
+        # Writes up to PIPE_BUF bytes are atomic, so workers can't interleave
+        if len(message) > select.PIPE_BUF:
+            print(f"Janitor path too long to forward: {path}")
+            return
+        try:
+            os.write(self._events_write, message)
+        except OSError as e:
+            print(f"Janitor could not forward {path}: {e}")
+
+    def _drain_events(self) -> None:
+        while True:
+            try:
+                data = os.read(self._events_read, 65536)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            *lines, self._pending = (self._pending + data).split(b"\n")
+            for line in lines:
+                op, path = line[:1], os.fsdecode(line[1:])
+                if op == b"+":
+                    self._register(path)
+                elif op == b"-":
+                    self._discard(path)
+
+    @staticmethod
+    def _scan(index: _FolderIndex) -> None:
+        found = []
+        if os.path.isdir(index.folder):
+            with os.scandir(index.folder) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        found.append((stat.st_mtime, entry.path, stat.st_size))
+        for mtime, path, size in sorted(found):
+            index.add(path, mtime, size)
+
+    def watch(self, folder: str, ttl_seconds: Optional[float] = None, max_bytes: Optional[int] = None) -> None:
+        """Starts tracking `folder`. A None TTL or quota disables that limit."""
+        folder = os.path.abspath(folder)
+        index = _FolderIndex(folder, ttl_seconds, max_bytes)
+        self._scan(index)
+        with self._lock:
+            self._indexes[folder] = index
+
+    def register(self, path: str) -> None:
+        """Records a newly written (or rewritten) file in its folder's index."""
+        path = os.path.abspath(path)
+        if self._is_remote():
+            self._send(b"+", path)
+        else:
+            self._register(path)
+
+    def _register(self, path: str) -> None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            index = self._indexes.get(os.path.dirname(path))
+            if index:
+                index.add(path, stat.st_mtime, stat.st_size)
+                self._dirty = True
+
+    def discard(self, path: str) -> None:
+        """Forgets a file that was removed by someone else."""
+        path = os.path.abspath(path)
+        if self._is_remote():
+            self._send(b"-", path)
+        else:
+            self._discard(path)
+
+    def _discard(self, path: str) -> None:
+        with self._lock:
+            index = self._indexes.get(os.path.dirname(path))
+            if index:
+                index.remove(path)
+                self._dirty = True
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Applies TTLs and quotas to every watched folder. Returns files deleted."""
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            for index in self._indexes.values():
+                removed += self._sweep_folder(index, now)
+            self._dirty = True
+        return removed
+
+    def _sweep_folder(self, index: _FolderIndex, now: float) -> int:
+        removed = 0
+        while index.entries:
+            path, (mtime, size) = next(iter(index.entries.items()))
+            expired = index.ttl_seconds is not None and now - mtime > index.ttl_seconds
+            # The newest file is never evicted for quota alone, so a result
+            # larger than the quota still survives until it is downloaded
+            over_quota = index.max_bytes is not None and index.total_bytes > index.max_bytes \
+                and len(index.entries) > 1
+            if not expired and not over_quota:
+                break
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                index.remove(path) # Already gone
+                continue
+            if stat.st_mtime > mtime:
+                # Still being written (e.g. a chunked upload); requeue as newest
+                index.add(path, stat.st_mtime, stat.st_size)
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Janitor could not remove {path}: {e}")
+            index.remove(path)
+        return removed
+
+    def _snapshot(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        with self._lock:
+            for folder, index in self._indexes.items():
+                oldest = next(iter(index.entries.values()), None)
+                result[folder] = {
+                    "files": len(index.entries),
+                    "bytes": index.total_bytes,
+                    "oldest_mtime": oldest[0] if oldest else None,
+                    "ttl_seconds": index.ttl_seconds,
+                    "max_bytes": index.max_bytes,
+                }
+            self._dirty = False
+        return result
+
+    def _write_stats(self) -> None:
+        snapshot = self._snapshot()
+        folder = os.path.dirname(self._stats_path)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix="storage-janitor-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self._stats_path) # Readers never see a partial file
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-folder file count, byte total, oldest file age and limits."""
+        if self._is_remote():
+            try:
+                with open(self._stats_path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                snapshot = {}
+        else:
+            snapshot = self._snapshot()
+        now = time.time()
+        for folder_stats in snapshot.values():
+            oldest_mtime = folder_stats.pop("oldest_mtime")
+            folder_stats["oldest_age_seconds"] = (now - oldest_mtime) if oldest_mtime is not None else None
+        return snapshot
+
+    def is_running(self) -> bool:
+        """Whether the sweep thread runs in this process (it doesn't survive a fork)."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Runs sweep() every `interval_seconds` on a daemon thread."""
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._events_write is not None and not self._is_remote():
+            os.write(self._events_write, b"\n") # Wake the sweep thread
+        if self._thread:
+            self._thread.join()
+        if self._stats_path and not self._is_remote():
+            try:
+                os.remove(self._stats_path)
+            except OSError:
+                pass
+
+    def _run(self) -> None:
+        next_sweep = time.monotonic() + self.interval_seconds
+        while not self._stop_event.is_set():
+            timeout = max(0.0, next_sweep - time.monotonic())
+            if self._events_read is None:
+                self._stop_event.wait(timeout)
+            else:
+                if self._dirty:
+                    # Batch snapshot writes, at most one a second
+                    timeout = min(timeout, max(0.0, self._stats_written + 1.0 - time.monotonic()))
+                if select.select([self._events_read], [], [], timeout)[0]:
+                    self._drain_events()
+            try:
+                if time.monotonic() >= next_sweep:
+                    self.sweep()
+                    next_sweep = time.monotonic() + self.interval_seconds
+                if self._stats_path and self._dirty and time.monotonic() - self._stats_written >= 1.0:
+                    self._write_stats()
+                    self._stats_written = time.monotonic()
+            except Exception as e:
+                print(f"Storage janitor sweep failed: {e}")
@@ -1,5 +1,6 @@
 # universal_file_compressor/utils.py
 import os
+import hashlib
 from typing import Tuple
 
 def get_formatted_size(size_bytes: int) -> str:
@@ -17,15 +18,41 @@ def get_formatted_size(size_bytes: int) -> str:
         i += 1
     return f"{size_bytes_float:.2f} {size_name[i]}"
 
+def get_file_sha256(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """Returns the SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def reserve_unique_path(folder: str, filename: str) -> str:
+    """
+    Atomically creates an empty file named `filename` in `folder`, or
+    `name_1.ext`, `name_2.ext`, ... if that is taken, and returns its path.
+    Concurrent jobs with the same file name therefore never overwrite each other.
+    """
+    name, ext = os.path.splitext(filename)
+    candidate = filename
+    counter = 0
+    while True:
+        path = os.path.join(folder, candidate)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return path
+        except FileExistsError:
+            counter += 1
+            candidate = f"{name}_{counter}{ext}"
+
 def create_output_folder(folder_name: str = "compressed") -> str:
     """Creates the output folder if it doesn't exist."""
-    if not os.path.exists(folder_name):
+    if not os.path.isdir(folder_name):
         try:
-            os.makedirs(folder_name)
+            os.makedirs(folder_name, exist_ok=True)
         except OSError as e:
             print(f"Error creating directory {folder_name}: {e}")
             # Fallback or raise, depending on desired strictness
             raise
     return folder_name
 
-OUTPUT_FOLDER = create_output_folder() # Ensure it's created at import time
\ No newline at end of file
+OUTPUT_FOLDER = "compressed" # Created on first use by the compressors, not at import time
\ No newline at end of file